@@ -0,0 +1,119 @@
+# Batched evaluation with NumPy:
+# Scores many positions at once, with the same terms as engine.evaluate() (material, piece-square
+# values and mobility), so the interpreter's cost is paid once per batch instead of once per position.
+# NumPy isn't part of the standard library: it's listed in requirements.txt.
+import numpy as np
+import engine as eng
+
+# Positions are encoded as (N,64) uint8 arrays: 0 for an empty tile, else 1+engine.BB_INDEX[side+key],
+# or as (N,12,64) arrays of 0/1 planes in engine.BB_INDEX order. Tiles are in board order (a8=0, h1=63).
+MATERIAL=np.array(eng.MATERIAL,dtype=np.int64)
+PIECE_SQUARE=np.array(eng.PIECE_SQUARE,dtype=np.int64)
+TILE_VALUES=np.array(eng.TILE_VALUES,dtype=np.int64).reshape(8,8)
+KNIGHT_STEPS=[(-2,1),(-1,2),(1,2),(2,1),(2,-1),(1,-2),(-1,-2),(-2,-1)]
+ROOK_STEPS=[(0,1),(1,0),(0,-1),(-1,0)]
+BISHOP_STEPS=[(1,1),(1,-1),(-1,1),(-1,-1)]
+
+# Encodes a board as a (64,) uint8 array:
+def encode(board):
+ ans=np.zeros(64,dtype=np.uint8)
+ for index,bb in enumerate(board.bitboards):
+  for square in eng.bit_scan(bb): ans[square]=index+1
+ return ans
+def encode_many(boards):
+ return np.stack([encode(board) for board in boards]) if boards else np.zeros((0,64),dtype=np.uint8)
+
+# (N,64) codes to (N,12,64) planes, planes are left as they are:
+def planes(positions):
+ positions=np.asarray(positions)
+ if positions.ndim==3: return positions.astype(bool)
+ return positions[:,None,:]==np.arange(1,13,dtype=np.uint8)[None,:,None]
+
+# Moves a stack of (N,8,8) grids by dx rows and dy columns, dropping what falls off:
+def _shift(grid,dx,dy):
+ ans=np.zeros_like(grid)
+ ans[:,max(dx,0):8+min(dx,0),max(dy,0):8+min(dy,0)]=grid[:,max(-dx,0):8+min(-dx,0),max(-dy,0):8+min(-dy,0)]
+ return ans
+# Number of pieces reaching each tile, for sliders going through empty tiles:
+def _slide(pieces,empty,steps):
+ ans=np.zeros_like(pieces)
+ for dx,dy in steps:
+  ray=_shift(pieces,dx,dy)
+  for i in range(6):
+   ans+=ray
+   ray=_shift(ray*empty,dx,dy)
+  ans+=ray
+ return ans
+
+# Mobility of one side, as in ChessBoard.mobility():
+# grids: (N,12,8,8) piece counts, side: "w" or "b".
+def _mobility(grids,side):
+ i=0 if side=="w" else 6
+ own=grids[:,i:i+6].sum(axis=1)
+ enemy=grids[:,6-i:12-i].sum(axis=1)
+ empty=1-own-enemy
+ free=1-own
+ # Pawns: pushes (2 from the start row) and captures to each side.
+ forward=-1 if side=="w" else 1
+ pawns=grids[:,i]
+ push=_shift(pawns,forward,0)*empty
+ jump=np.zeros_like(push)
+ start=5 if side=="w" else 2
+ jump[:,start]=push[:,start]
+ jump=_shift(jump,forward,0)*empty
+ mobility=eng.PIECE_VALUES["P"]*((push+jump+(_shift(pawns,forward,-1)+_shift(pawns,forward,1))*enemy)*TILE_VALUES).sum(axis=(1,2))
+ # Other pieces (the King is worth nothing here):
+ knights=sum(_shift(grids[:,i+1],dx,dy) for dx,dy in KNIGHT_STEPS)
+ mobility+=eng.PIECE_VALUES["N"]*(knights*free*TILE_VALUES).sum(axis=(1,2))
+ for key,index,steps in (("B",2,BISHOP_STEPS),("R",3,ROOK_STEPS),("Q",4,ROOK_STEPS+BISHOP_STEPS)):
+  mobility+=eng.PIECE_VALUES[key]*(_slide(grids[:,i+index],empty,steps)*free*TILE_VALUES).sum(axis=(1,2))
+ return mobility
+
+# Scores N positions like engine.evaluate(board,side):
+# side: "w", "b", or an (N,) array of them (or of 0 for white, 1 for black).
+def evaluate(positions,side="w"):
+ bits=planes(positions)
+ counts=bits.sum(axis=2,dtype=np.int64)
+ psqt=(bits*PIECE_SQUARE).sum(axis=2)
+ grids=bits.reshape(-1,12,8,8).astype(np.int64)
+ white=psqt[:,:6].sum(axis=1)+_mobility(grids,"w")+10*counts[:,:6]@MATERIAL[:6]
+ black=psqt[:,6:].sum(axis=1)+_mobility(grids,"b")+10*counts[:,6:]@MATERIAL[6:]
+ side=np.asarray(side)
+ if side.dtype.kind in "US": side=side=="b"
+ return np.where(side.astype(bool),black-white,white-black)
+
+# Search that evaluates its horizon in batches:
+# the tree is walked to depth first, every leaf is encoded, all leaves are scored in one
+# evaluate() call, then scores are backed up by negamax. There's no pruning, as no score
+# is known until the walk is done, so this suits shallow searches over many positions.
+# Returns (score,move) like engine.negamax: score from side's view, move packed.
+def search(board,depth,side=None):
+ side=side or board.side
+ if board.side!=side: board.set_side(side)
+ leaves=[]
+ leaf_sides=[]
+ # A node is an index into leaves, or a list of (move,node).
+ def expand(depth,side):
+  moves=board.move_list(side) if depth>0 else ()
+  if not moves:
+   leaves.append(encode(board))
+   leaf_sides.append(side=="b")
+   return len(leaves)-1
+  opponent="bw"[side=="b"]
+  ans=[]
+  for move in moves:
+   record=board.make_move(move)
+   ans.append((move,expand(depth-1,opponent)))
+   board.unmake_move(record)
+  return ans
+ tree=expand(depth,side)
+ # evaluate() scores a side with negative weights, so the side moving wants its lowest score.
+ scores=-evaluate(np.stack(leaves),np.array(leaf_sides))
+ def back_up(node):
+  if not isinstance(node,list): return int(scores[node]),None
+  best_score,best_move=float('-inf'),None
+  for move,child in node:
+   score=-back_up(child)[0]
+   if score>best_score: best_score,best_move=score,move
+  return best_score,best_move
+ return back_up(tree)
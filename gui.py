@@ -1,7 +1,9 @@
 # Tkinter related classes:
 import tkinter as tk
 import engine as eng
-import random
+import book
+import tablebase
+import os
 
 # Custom color class to define different colors:
 class Color:
@@ -151,7 +153,7 @@ class FrameRound(tk.Frame):
   side="bw"[mod]
   # Restores board to the previous state:
   print('state',states[-1][1])
-  board.D_load_state(*states.pop(-1))
+  board.D_load_state(*states.pop(-1),side=side)
   # Updates who gets to move in this state:
   board.V_side.set(side)
   board.D_allow_side(auto=False)
@@ -201,6 +203,12 @@ class FrameBoard(tk.Frame):
   # Other attributes:
   self.V_holder=holder # In case a query on holder is needed
   self.V_prestates=[] # List of locations with a prestate:
+  self.V_table=eng.TranspositionTable(16) # Bot's transposition table, kept between moves
+  self.V_think=1.0 # Bot's time to think per move, in seconds
+  # Bot's Polyglot opening book, if there's a book.bin:
+  self.V_book=book.OpeningBook('book.bin') if os.path.exists('book.bin') else None
+  # Endgame tables made with tablebase.py, if there are any:
+  self.V_tablebase=tablebase.Tablebases('tablebases') if os.path.isdir('tablebases') else None
   # Startup functions:
   self.D_start()
   self.D_allow_side(auto=False)
@@ -222,10 +230,16 @@ class FrameBoard(tk.Frame):
   board=self.V_board
   # If bot side:
   if auto and frame_side in "b":
-   move=eng.minimax(board,depth=2,side="b",max_="b")
+   # Plays from the book while it can, then searches:
+   if board.side!="b": board.set_side("b")
+   book_move=self.V_book.choose(board) if self.V_book else None
+   if book_move is not None:
+    src,dst,promote=eng.unpack_move(book_move)
+    move=(0,(src.addr,dst,promote))
+   else: move=eng.minimax(board,depth=64,side="b",max_="b",tt=self.V_table,time_limit=self.V_think,tablebase=self.V_tablebase)
    if move[1] is not None:
     data=move[1]
-    self.D_move_tile(self[data[0]],self[data[1].addr],random.choice(list("QRNB")))
+    self.D_move_tile(self[data[0]],self[data[1].addr],data[2])
     return None
   for addr in self:
    tile=self[addr]
@@ -395,9 +409,9 @@ class FrameBoard(tk.Frame):
    tile.V_color=color
 
  # Loads the board to a state set by engine's chessboard:
- def D_load_state(self,state,update_next=[]):
+ def D_load_state(self,state,update_next=[],side="w"):
   self.D_clear_prestates()
-  self.V_board.__init__(state,update_next=update_next)
+  self.V_board.__init__(state,update_next=update_next,side=side)
   print('update_next',self.V_board.update_next)
   for addr in self.V_tiles:
    tile=self.V_tiles[addr]
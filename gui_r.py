@@ -151,7 +151,7 @@ class FrameRound(tk.Frame):
   side="bw"[mod]
   # Restores board to the previous state:
   print('state',states[-1][1])
-  board.D_load_state(*states.pop(-1))
+  board.D_load_state(*states.pop(-1),side=side)
   # Updates who gets to move in this state:
   board.V_side.set(side)
   board.D_allow_side(auto=False)
@@ -409,9 +409,9 @@ class FrameBoard(tk.Frame):
    tile.V_color=color
 
  # Loads the board to a state set by engine's chessboard:
- def D_load_state(self,state,update_next=[]):
+ def D_load_state(self,state,update_next=[],side="w"):
   self.D_clear_prestates()
-  self.V_board.__init__(state,update_next=update_next)
+  self.V_board.__init__(state,update_next=update_next,side=side)
   print('update_next',self.V_board.update_next)
   for addr in self.V_tiles:
    tile=self.V_tiles[addr]
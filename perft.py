@@ -0,0 +1,116 @@
+# Perft: counts the leaf nodes of the move tree to a given depth.
+# Results can be compared with known counts to find move generation bugs.
+import argparse
+import sys
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+import engine as eng
+
+START="rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+# Known counts of well tested positions (by depth, from 1), to check move generation against:
+# the start position, Kiwipete, then positions 3 to 6 of the Chess Programming Wiki's perft results.
+KNOWN=[
+ (START,[20,400,8902,197281,4865609]),
+ ("r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",[48,2039,97862,4085603]),
+ ("8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",[14,191,2812,43238,674624]),
+ ("r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",[6,264,9467,422333]),
+ ("rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",[44,1486,62379,2103487]),
+ ("r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",[46,2079,89890,3894594])]
+
+# Counts of subtrees, so a position reached again doesn't have to be searched again.
+class PerftCache:
+ def __init__(self,size=16):
+  # size: memory used by the cache, in megabytes. Each entry takes 16 bytes.
+  self.size=size
+  self.entries=max(1,size*2**20//16)
+  self.keys=array('Q',bytes(8*self.entries))
+  # Layout: nodes<<8 | depth
+  self.data=array('Q',bytes(8*self.entries))
+ def __repr__(self):
+  return f'PerftCache({self.size}MB)'
+ def probe(self,key,depth):
+  index=(key^depth)%self.entries
+  data=self.data[index]
+  if self.keys[index]==key and data&255==depth: return data>>8
+  return None
+ def store(self,key,depth,nodes):
+  index=(key^depth)%self.entries
+  self.keys[index]=key
+  self.data[index]=nodes<<8|depth
+
+# Number of leaf nodes depth moves from the board:
+def perft(board,depth,cache=None):
+ if depth<=0: return 1
+ moves=board.move_list(board.side)
+ # Bulk counting: the last moves don't need to be played.
+ if depth==1: return len(moves)
+ if cache:
+  nodes=cache.probe(board.key,depth)
+  if nodes is not None: return nodes
+ nodes=0
+ for move in moves:
+  record=board.make_move(move)
+  nodes+=perft(board,depth-1,cache)
+  board.unmake_move(record)
+ if cache: cache.store(board.key,depth,nodes)
+ return nodes
+
+# Runs one root move in a worker process:
+def _perft_move(fen,move,depth,hash_size):
+ board=eng.ChessBoard(fen)
+ board.make_move(move)
+ return perft(board,depth-1,PerftCache(hash_size) if hash_size else None)
+
+# Perft of each root move, as {move name: nodes}.
+# processes: if set, root moves are shared out between that many processes.
+# hash_size: megabytes of PerftCache to use, 0 for none.
+def divide(fen,depth,processes=None,hash_size=0):
+ board=eng.ChessBoard(fen)
+ moves=board.move_list(board.side)
+ if processes:
+  with ProcessPoolExecutor(processes) as pool:
+   counts=pool.map(_perft_move,[fen]*len(moves),moves,[depth]*len(moves),[hash_size]*len(moves))
+   return dict(zip(map(eng.move_name,moves),counts))
+ cache=PerftCache(hash_size) if hash_size else None
+ ans={}
+ for move in moves:
+  record=board.make_move(move)
+  ans[eng.move_name(move)]=perft(board,depth-1,cache)
+  board.unmake_move(record)
+ return ans
+
+# Compares the counts of KNOWN positions up to max_depth (all of them if None), printing each one.
+# Returns the number of wrong counts.
+def check(max_depth=None,processes=None,hash_size=0):
+ wrong=0
+ for fen,counts in KNOWN:
+  for depth,expected in enumerate(counts[:max_depth],1):
+   nodes=sum(divide(fen,depth,processes,hash_size).values())
+   wrong+=nodes!=expected
+   print(f'{fen} depth {depth}: {nodes} {"OK" if nodes==expected else f"WRONG, expected {expected}"}')
+ return wrong
+
+if __name__=="__main__":
+ parser=argparse.ArgumentParser(description="Counts the move tree of a position.")
+ parser.add_argument("depth",type=int,nargs="?",help="depth to count to (with --check: the deepest depth to check)")
+ parser.add_argument("--check",action="store_true",help="check the counts of known positions")
+ parser.add_argument("--fen",default=START)
+ parser.add_argument("--divide",action="store_true",help="show the count of each root move")
+ parser.add_argument("--processes",type=int,default=None,help="share root moves out between processes")
+ parser.add_argument("--hash",type=int,default=0,help="megabytes of cache for repeated positions")
+ args=parser.parse_args()
+ if args.check:
+  wrong=check(args.depth,args.processes,args.hash)
+  print(f'{wrong} wrong counts' if wrong else 'All counts OK')
+  sys.exit(1 if wrong else 0)
+ if args.depth is None: parser.error("depth is needed (unless --check)")
+ start=time.perf_counter()
+ counts=divide(args.fen,args.depth,args.processes,args.hash)
+ elapsed=time.perf_counter()-start
+ if args.divide:
+  for move,nodes in counts.items(): print(f'{move}: {nodes}')
+ nodes=sum(counts.values())
+ print(f'Nodes: {nodes}')
+ print(f'Time: {elapsed:.3f}s')
+ print(f'Nodes/second: {nodes/elapsed:.0f}' if elapsed else 'Nodes/second: -')
@@ -0,0 +1,115 @@
+# PGN reader:
+# Streams games from a PGN file line by line, so a file of any size can be read: only the game being
+# read is kept. Each game is its headers, its main line as SAN moves and its result; comments ({} and ;),
+# variations (()), NAGs ($1) and move numbers are skipped. Moves are resolved on a board with
+# engine.parse_san when a game is replayed.
+import argparse
+import re
+import time
+import engine as eng
+
+START="rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+RESULTS={"1-0","0-1","1/2-1/2","*"}
+# Tag values run to the last quote, as quotes in them aren't always escaped.
+HEADER=re.compile(r'\[\s*(\w+)\s+"(.*)"\s*\]')
+# Movetext tokens, after any spaces: comment/variation marks, NAGs, move numbers, results, then moves.
+TOKEN=re.compile(r'\s*([{}();]|\$\d+|\d+\.+|1-0|0-1|1/2-1/2|\*|[^\s{}();$]+)')
+
+class Game:
+ def __init__(self):
+  self.headers={}
+  self.moves=[] # SAN moves of the main line
+  self.result="*"
+ def __repr__(self):
+  return f'Game({self.headers.get("White","?")} vs {self.headers.get("Black","?")}, {len(self.moves)} moves, {self.result})'
+ # Board the game starts from (the FEN header if there's one):
+ def board(self):
+  return eng.ChessBoard(self.headers.get("FEN",START))
+ # Plays the game through, yielding (board,packed move) before each move.
+ # The board is the same object each time, changed by the move after it's yielded: use board.fen()
+ # or pack_board() to keep a position. Raises an Exception on a move that isn't legal.
+ def replay(self):
+  board=self.board()
+  for san in self.moves:
+   move=eng.parse_san(board,san)
+   yield board,move
+   board.make_move(move)
+
+# Games of a PGN file (a path or an open text file), one at a time:
+def read_games(file):
+ if isinstance(file,str):
+  with open(file,encoding="utf-8-sig",errors="replace") as f: yield from read_games(f)
+  return
+ game=None
+ comment=False # Inside a {} comment
+ depth=0 # Variation depth
+ for line in file:
+  if not comment and not depth:
+   # Escaped lines:
+   if line.startswith("%"): continue
+   if line.lstrip().startswith("["):
+    match=HEADER.match(line.lstrip())
+    if match:
+     # Headers after moves start the next game (if it had no result):
+     if game is not None and game.moves:
+      yield game
+      game=None
+     if game is None: game=Game()
+     game.headers[match[1]]=match[2].replace('\\"','"').replace('\\\\','\\')
+     continue
+  pos=0
+  while pos<len(line):
+   if comment:
+    end=line.find("}",pos)
+    if end==-1: break
+    comment=False
+    pos=end+1
+    continue
+   match=TOKEN.match(line,pos)
+   if not match: break
+   pos=match.end()
+   token=match[1]
+   if token=="{": comment=True
+   elif token==";": break
+   elif token=="(": depth+=1
+   elif token==")": depth=max(depth-1,0)
+   elif depth or token=="}" or token[0]=="$" or token[0].isdigit() and token[-1]==".": continue
+   elif token in RESULTS:
+    if game is None: game=Game()
+    game.result=token
+    yield game
+    game=None
+   else:
+    if game is None: game=Game()
+    game.moves.append(token)
+ if game is not None and (game.moves or game.headers): yield game
+
+# Every position of every game in a file, as (game,board,packed move) like Game.replay().
+# strict: if False, a game with a bad move is left at that move and the next game is read.
+def positions(file,strict=True):
+ for game in read_games(file):
+  try: yield from ((game,board,move) for board,move in game.replay())
+  except Exception:
+   if strict: raise
+
+if __name__=="__main__":
+ parser=argparse.ArgumentParser(description="Replays the games of a PGN file.")
+ parser.add_argument("file")
+ parser.add_argument("--fen",action="store_true",help="show each position's FEN and move")
+ args=parser.parse_args()
+ start=time.perf_counter()
+ games=moves=bad=0
+ for game in read_games(args.file):
+  games+=1
+  try:
+   for board,move in game.replay():
+    if args.fen: print(board.fen(),eng.move_name(move))
+    moves+=1
+  except Exception as error:
+   bad+=1
+   print(f'Game {games} {game}: {error}')
+ elapsed=time.perf_counter()-start
+ print(f'Games: {games} ({bad} with bad moves)')
+ print(f'Moves: {moves}')
+ print(f'Time: {elapsed:.3f}s')
+ print(f'Moves/second: {moves/elapsed:.0f}' if elapsed else 'Moves/second: -')
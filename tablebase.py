@@ -0,0 +1,330 @@
+# Endgame tablebases:
+# Tables of every position of a small piece set (one side with a King and a few pieces, the other with a
+# lone King), telling if the side to move wins, draws or loses, and in how many plies it ends in mate.
+# They're made here by retrograde analysis and saved bit-packed, one file per piece set, then read
+# through mmap, so a probe is a few bytes read from the file and nothing is loaded up front.
+import argparse
+import mmap
+import os
+import struct
+import time
+from array import array
+import engine as eng
+
+# Positions are stored as if the strong side (the one with pieces) is white. Pieces are listed strong
+# King first, then the other pieces in the table's name order, then the weak King.
+# Index: ((region of the strong King*64+square)*64+square...)*2+side to move (0: white).
+# Tables without Pawns use the 8 symmetries of the board to keep the strong King in the a1-d1-d4
+# triangle (10 squares), tables with Pawns only mirror the columns, keeping it on columns a-d (32).
+# A King on the a1-d4 diagonal can be put in the triangle 2 ways: the lowest index is used, so each
+# position has just one index (the other is never used).
+# Values are 0 for a draw (or an impossible index), else plies to mate+1: odd plies are wins for the
+# side to move, even plies losses (0 plies: mated).
+TABLES=["KQK","KRK","KPK","KBNK"]
+DRAWN={"KK","KBK","KNK"} # Nobody can mate, no table needed.
+HEADER=struct.Struct(">4s8sBI") # magic, name, bits per value, values
+MAGIC=b"CTB1"
+TB_WIN=100000 # Score of a won position mated in 0 plies, one less per ply.
+
+def _transform(square,t):
+ x,y=square>>3,square&7
+ if t&1: y=7-y
+ if t&2: x=7-x
+ if t&4: x,y=y,x
+ return x*8+y
+SYMMETRIES=[[_transform(square,t) for square in range(64)] for t in range(8)]
+# a1-d1-d4 in board order (a1=56): rows 4-7, columns 0-3, column>=7-row.
+TRIANGLE=[square for square in range(64) if square>>3>=4 and square&7<=3 and square&7>=7-(square>>3)]
+HALF=[square for square in range(64) if square&7<=3]
+def _king_transforms(region,transforms):
+ return [[t for t in transforms if SYMMETRIES[t][square] in region] for square in range(64)]
+PAWNLESS=(TRIANGLE,{square:i for i,square in enumerate(TRIANGLE)},_king_transforms(TRIANGLE,range(8)))
+PAWNS=(HALF,{square:i for i,square in enumerate(HALF)},_king_transforms(HALF,(0,1)))
+
+# Squares attacked by one of the strong side's pieces:
+def _attacks(key,square,occupancy):
+ if key=="K": return eng.KING_ATTACKS[square]
+ if key=="N": return eng.KNIGHT_ATTACKS[square]
+ if key=="B": return eng.bishop_attacks(square,occupancy)
+ if key=="R": return eng.rook_attacks(square,occupancy)
+ if key=="Q": return eng.queen_attacks(square,occupancy)
+ return eng.PAWN_ATTACKS["w"][square]
+
+class Table:
+ def __init__(self,name):
+  self.name=name
+  self.keys=list(name[:-1]) # strong side's pieces, King first
+  self.region,self.region_index,self.king_transforms=PAWNS if "P" in name else PAWNLESS
+  self.size=len(self.region)*64**len(self.keys)*2
+ def __repr__(self):
+  return f'Table({self.name})'
+ # Index of a position (squares in table order, side: 0 white, 1 black to move), after symmetries:
+ def index(self,squares,side):
+  best=None
+  for t in self.king_transforms[squares[0]]:
+   symmetry=SYMMETRIES[t]
+   ans=self.region_index[symmetry[squares[0]]]
+   for square in squares[1:]: ans=ans*64+symmetry[square]
+   if best is None or ans<best: best=ans
+  return best*2+side
+ def squares(self,index):
+  side=index&1
+  index>>=1
+  ans=[]
+  for i in range(len(self.keys)):
+   index,square=divmod(index,64)
+   ans.append(square)
+  ans.append(self.region[index])
+  ans.reverse()
+  return ans,side
+ # Strong side's attacks on the board:
+ def attacks(self,squares,occupancy,skip=-1):
+  ans=0
+  for i,key in enumerate(self.keys):
+   if i!=skip: ans|=_attacks(key,squares[i],occupancy)
+  return ans
+ # If a position can happen: no 2 pieces on a square, Pawns off the end rows, the side that just
+ # moved not in check.
+ def legal(self,squares,side):
+  occupancy=0
+  for square in squares:
+   if occupancy>>square&1: return False
+   occupancy|=1<<square
+  for i,key in enumerate(self.keys):
+   if key=="P" and not 7<squares[i]<56: return False
+  king,weak=squares[0],squares[-1]
+  if eng.KING_ATTACKS[king]>>weak&1: return False
+  if side==0 and self.attacks(squares,occupancy)>>weak&1: return False
+  return True
+ # Moves of the side to move, as (new squares, None) for moves staying in the table, or
+ # (None, (table name, squares, side)) for captures and promotions leaving it.
+ def moves(self,squares,side):
+  occupancy=0
+  for square in squares: occupancy|=1<<square
+  weak=squares[-1]
+  if side==0:
+   own=occupancy&~(1<<weak)
+   for i,key in enumerate(self.keys):
+    square=squares[i]
+    if key=="P":
+     targets=0
+     if not occupancy>>(square-8)&1:
+      targets|=1<<(square-8)
+      if square>>3==6 and not occupancy>>(square-16)&1: targets|=1<<(square-16)
+    else: targets=_attacks(key,square,occupancy)&~own
+    if key=="K": targets&=~eng.KING_ATTACKS[weak]
+    for target in eng.bit_scan(targets):
+     new=squares[:i]+[target]+squares[i+1:]
+     # Promotion:
+     if key=="P" and target<8:
+      for promote in "QRBN":
+       yield None,(self.name[:i]+promote+self.name[i+1:],new,1)
+     else: yield new,None
+  else:
+   for target in eng.bit_scan(eng.KING_ATTACKS[weak]):
+    taken=next((i for i,square in enumerate(squares[:-1]) if square==target),-1)
+    if taken==0: continue
+    # The King can't go where it's attacked, seeing through its own tile:
+    rest=occupancy&~(1<<weak)
+    if self.attacks(squares,rest,taken)>>target&1: continue
+    if taken==-1: yield squares[:-1]+[target],None
+    else: yield None,(self.name[:taken]+self.name[taken+1:],squares[:taken]+squares[taken+1:-1]+[target],0)
+ # Positions one move before, by the side that isn't to move, staying in the table:
+ def unmoves(self,squares,side):
+  occupancy=0
+  for square in squares: occupancy|=1<<square
+  empty=~occupancy
+  if side==1:
+   for i,key in enumerate(self.keys):
+    square=squares[i]
+    if key=="P":
+     origins=0
+     if 1<<(square+8)&empty and square+8<56:
+      origins|=1<<(square+8)
+      if square>>3==4 and 1<<(square+16)&empty: origins|=1<<(square+16)
+    else: origins=_attacks(key,square,occupancy)&empty
+    for origin in eng.bit_scan(origins):
+     yield squares[:i]+[origin]+squares[i+1:]
+  else:
+   for origin in eng.bit_scan(eng.KING_ATTACKS[squares[-1]]&empty):
+    yield squares[:-1]+[origin]
+
+# Looks up a position of another table while making one: squares and side as given by Table.moves.
+def _lookup(tables,name,squares,side):
+ if name in DRAWN: return 0
+ table=tables[name]
+ return table.value(table.index(squares,side))
+
+# Makes a table by retrograde analysis.
+# tables: {name: TablebaseFile} of the tables captures and promotions lead to.
+# Returns an array('H') of values by index.
+def generate(name,tables={},verbose=False):
+ table=Table(name)
+ size=table.size
+ values=array('H',bytes(2*size))
+ # state: 0 unknown, 1 done, 2 impossible. flags: 1 a move leaves to a draw, 2 a move leaves to a win.
+ state=bytearray(size)
+ flags=bytearray(size)
+ counter=array('H',bytes(2*size)) # Moves staying in the table that aren't known to lose yet
+ longest=array('H',bytes(2*size)) # Longest of the opponent's wins (plies) found so far
+ buckets=[[]] # Positions to settle at each ply
+ def schedule(index,plies):
+  while len(buckets)<=plies: buckets.append([])
+  buckets[plies].append(index)
+ start=time.perf_counter()
+ # First pass: counts the moves of every position, and settles mates and moves leaving the table.
+ for index in range(size):
+  squares,side=table.squares(index)
+  if not table.legal(squares,side) or table.index(squares,side)!=index:
+   state[index]=2
+   continue
+  children=set()
+  win=None
+  any_move=False
+  for new,leave in table.moves(squares,side):
+   any_move=True
+   if new is not None:
+    children.add(table.index(new,1-side))
+    continue
+   value=_lookup(tables,*leave)
+   if not value: flags[index]|=1
+   elif (value-1)&1: longest[index]=max(longest[index],value-1)
+   else:
+    flags[index]|=2
+    win=value if win is None else min(win,value)
+  counter[index]=len(children)
+  if win is not None: schedule(index,win)
+  elif not any_move:
+   # Mated (the lone King in check) or stalemated:
+   if side==1 and table.attacks(squares,sum(1<<square for square in squares))>>squares[-1]&1: schedule(index,0)
+   else: state[index]=1
+  elif not counter[index] and not flags[index]&1: schedule(index,longest[index]+1)
+ if verbose: print(f'{name}: {size} positions counted in {time.perf_counter()-start:.1f}s')
+ # Settles positions ply by ply, going back from each one to the positions that can reach it.
+ plies=0
+ while plies<len(buckets):
+  for index in buckets[plies]:
+   if state[index]: continue
+   state[index]=1
+   values[index]=plies+1
+   squares,side=table.squares(index)
+   previous=set()
+   for origin in table.unmoves(squares,side):
+    if table.legal(origin,1-side): previous.add(table.index(origin,1-side))
+   for before in previous:
+    if state[before]: continue
+    # A loss here is a win for whoever moved into it:
+    if not plies&1: schedule(before,plies+1)
+    else:
+     counter[before]-=1
+     longest[before]=max(longest[before],plies)
+     if not counter[before] and not flags[before]&3: schedule(before,longest[before]+1)
+  buckets[plies]=None
+  plies+=1
+ # Whatever is left can be held: draws.
+ if verbose: print(f'{name}: done in {time.perf_counter()-start:.1f}s, longest mate {len(buckets)-1} plies')
+ return values
+
+# Saves values bit-packed, with as many bits as the largest value needs:
+def save(path,name,values):
+ width=max(1,max(values).bit_length())
+ with open(path,"wb") as file:
+  file.write(HEADER.pack(MAGIC,name.encode(),width,len(values)))
+  # 8 values make width bytes:
+  for i in range(0,len(values),8):
+   word=0
+   for j,value in enumerate(values[i:i+8]): word|=value<<(j*width)
+   file.write(word.to_bytes(width,"little"))
+
+# A saved table, read through mmap:
+class TablebaseFile:
+ def __init__(self,path):
+  self.path=path
+  self.file=open(path,"rb")
+  self.map=mmap.mmap(self.file.fileno(),0,access=mmap.ACCESS_READ)
+  magic,name,self.width,self.count=HEADER.unpack_from(self.map)
+  if magic!=MAGIC: raise Exception('Not a tablebase file:',path)
+  self.name=name.rstrip(b"\0").decode()
+  self.table=Table(self.name)
+  self.mask=(1<<self.width)-1
+ def __repr__(self):
+  return f'TablebaseFile({self.name}, {self.width} bits)'
+ def close(self):
+  self.map.close()
+  self.file.close()
+ def value(self,index):
+  bit=index*self.width
+  start=HEADER.size+(bit>>3)
+  return int.from_bytes(self.map[start:start+(self.width+14)//8],"little")>>(bit&7)&self.mask
+ def index(self,squares,side):
+  return self.table.index(squares,side)
+
+# All tables found in a directory (files named like KQK.tb), probed by the search.
+class Tablebases:
+ def __init__(self,directory="tablebases"):
+  self.directory=directory
+  self.tables={}
+  if os.path.isdir(directory):
+   for file in sorted(os.listdir(directory)):
+    if file.endswith(".tb"):
+     table=TablebaseFile(os.path.join(directory,file))
+     self.tables[table.name]=table
+  self.max_pieces=max([len(name) for name in self.tables]+[0])
+ def __repr__(self):
+  return f'Tablebases({", ".join(self.tables)})'
+ # Sent to other processes by directory, each one maps the files itself:
+ def __getstate__(self):
+  return self.directory
+ def __setstate__(self,directory):
+  self.__init__(directory)
+ def close(self):
+  for table in self.tables.values(): table.close()
+ # Result from the side to move's view as (1: win, 0: draw, -1: loss, plies to mate), or None if no
+ # table has the position. A side that is mated loses in 0 plies, so the plies alone don't tell it from a draw.
+ def probe(self,board):
+  if eng.popcount(board.occupancy)>self.max_pieces or board.castling(): return None
+  pieces={}
+  # Pieces in the order of table names (KQRBNP):
+  for side in "wb":
+   pieces[side]="".join(key*eng.popcount(board.bitboards[eng.BB_INDEX[side+key]]) for key in "KQRBNP")
+  if pieces["b"]=="K": strong,flip="w",0
+  elif pieces["w"]=="K": strong,flip="b",56
+  else: return None
+  name=pieces[strong]+"K"
+  if name in DRAWN: return 0,0
+  table=self.tables.get(name)
+  if table is None: return None
+  # Squares in table order, flipped so the strong side plays up the board like white:
+  squares=[]
+  for key in table.name[:-1]:
+   bb=board.bitboards[eng.BB_INDEX[strong+key]]
+   squares.append((bb.bit_length()-1)^flip)
+  squares.append((board.bits("wb"[strong=="w"],"K").bit_length()-1)^flip)
+  value=table.value(table.index(squares,(board.side!=strong)*1))
+  if not value: return 0,0
+  return (1 if (value-1)&1 else -1),value-1
+ # Search score of the position from the side to move's view, or None:
+ def score(self,board):
+  result=self.probe(board)
+  if result is None: return None
+  result,plies=result
+  if result>0: return TB_WIN-plies
+  if result<0: return -TB_WIN+plies
+  return 0
+
+if __name__=="__main__":
+ parser=argparse.ArgumentParser(description="Makes endgame tablebases.")
+ parser.add_argument("tables",nargs="*",default=TABLES,help=f"piece sets, from {', '.join(TABLES)}")
+ parser.add_argument("--dir",default="tablebases")
+ args=parser.parse_args()
+ os.makedirs(args.dir,exist_ok=True)
+ made={}
+ # Tables a set leads to (by capture or promotion) are made first:
+ def make(name):
+  path=os.path.join(args.dir,f'{name}.tb')
+  if not os.path.exists(path):
+   if "P" in name:
+    for promote in "QR": make(name.replace("P",promote,1))
+   save(path,name,generate(name,made,verbose=True))
+  made[name]=TablebaseFile(path)
+ for name in args.tables: make(name)